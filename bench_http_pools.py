@@ -0,0 +1,160 @@
+"""
+HTTP pool benchmark against a local fake Bot API server
+
+Compares the old setup with the tuned pools from bot.build_http_requests().
+The old setup is what ApplicationBuilder built from .connect_timeout(20)
+etc.: an API request with 20s timeouts and PTB's default pool size, plus a
+separate default HTTPXRequest for getUpdates. While a getUpdates long poll is running, bursts
+of concurrent API calls are fired and their latency and pool timeouts are
+measured.
+
+Usage:
+    python bench_http_pools.py
+    python bench_http_pools.py --burst 100 --rounds 5 --latency-ms 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+from time import monotonic
+
+# bot.py builds its Gemini client at import time; no calls are made here
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from telegram import Bot
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+import bot
+
+TOKEN = "123456:benchmark"
+
+
+# ========== FAKE BOT API SERVER ==========
+class FakeBotAPI:
+    """Minimal HTTP/1.1 keep-alive server speaking just enough Bot API"""
+
+    def __init__(self, latency: float, long_poll: float):
+        self.latency = latency
+        self.long_poll = long_poll
+        self.server = None
+        self.port = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                path = request_line.split()[1].decode()
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b""):
+                        break
+                    name, _, value = header.decode().partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value.strip())
+                if length:
+                    await reader.readexactly(length)
+
+                method = path.rsplit("/", 1)[-1]
+                if method == "getUpdates":
+                    await asyncio.sleep(self.long_poll)
+                    result = []
+                elif method == "getMe":
+                    result = {"id": 1, "is_bot": True, "first_name": "Ishani", "username": "ishani_bot"}
+                else:
+                    await asyncio.sleep(self.latency)
+                    result = True
+
+                body = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+# ========== SCENARIOS ==========
+def legacy_requests():
+    return (
+        HTTPXRequest(connect_timeout=20, read_timeout=20, write_timeout=20, pool_timeout=20),
+        HTTPXRequest(),
+    )
+
+
+async def run_scenario(name: str, requests, server: FakeBotAPI, burst: int, rounds: int):
+    api_request, updates_request = requests
+    telegram_bot = Bot(
+        TOKEN,
+        base_url=f"http://127.0.0.1:{server.port}/bot",
+        request=api_request,
+        get_updates_request=updates_request,
+    )
+    latencies = []
+    timeouts = 0
+
+    async def api_call():
+        nonlocal timeouts
+        started = monotonic()
+        try:
+            await telegram_bot.send_chat_action(chat_id=1, action="typing")
+            latencies.append(monotonic() - started)
+        except TimedOut:
+            timeouts += 1
+
+    async with telegram_bot:
+        started = monotonic()
+        for _ in range(rounds):
+            poll = asyncio.create_task(telegram_bot.get_updates(timeout=int(server.long_poll)))
+            await asyncio.sleep(0.05)  # Let the long poll grab its connection
+            await asyncio.gather(*(api_call() for _ in range(burst)))
+            await poll
+        elapsed = monotonic() - started
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else float("nan")
+    print(
+        f"{name:>8} | calls {len(latencies):>5} | timeouts {timeouts:>4} | "
+        f"p50 {p50:>7.0f}ms | p95 {p95:>7.0f}ms | total {elapsed:>5.1f}s"
+    )
+    if isinstance(api_request, bot.InstrumentedHTTPXRequest):
+        print(f"{'':>8} | api pool metrics: {api_request.metrics()}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark Bot API connection pools")
+    parser.add_argument("--burst", type=int, default=50, help="Concurrent API calls per round")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake server latency per API call")
+    parser.add_argument("--long-poll", type=float, default=2, help="getUpdates long-poll seconds")
+    args = parser.parse_args()
+
+    server = FakeBotAPI(args.latency_ms / 1000, args.long_poll)
+    await server.start()
+    try:
+        await run_scenario("legacy", legacy_requests(), server, args.burst, args.rounds)
+        await run_scenario("split", bot.build_http_requests(), server, args.burst, args.rounds)
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
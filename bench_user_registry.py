@@ -0,0 +1,98 @@
+"""
+Memory benchmark: legacy dict-per-user layout vs compact UserRegistry
+
+Usage:
+    python bench_user_registry.py            # 100k and 1M synthetic users
+    python bench_user_registry.py 250000     # custom sizes
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# bot.py builds its Gemini client at import time; no calls are made here
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from bot import UserRegistry
+
+FIRST_NAMES = [
+    "Rahul", "Priya", "Amit", "Sneha", "Vikram", "Anjali", "Rohit", "Pooja",
+    "Arjun", "Neha", "Suresh", "Kavita", "Manoj", "Divya", "Sanjay", "Ritu",
+]
+BASE_TS = int(datetime(2026, 1, 1).timestamp())
+
+
+def synthetic_users(n: int):
+    for i in range(n):
+        user_id = 5_000_000_000 + i * 7919
+        # Build a fresh string per user, the way json.load would
+        name = (FIRST_NAMES[i % len(FIRST_NAMES)] + " ")[:-1]
+        yield user_id, name, (i % 50) + 1, BASE_TS + i
+
+
+def build_legacy(n: int):
+    users = {}
+    for user_id, name, count, seen_at in synthetic_users(n):
+        users[str(user_id)] = {
+            "user_id": user_id,
+            "first_name": name,
+            "message_count": count,
+            "last_seen": datetime.fromtimestamp(seen_at).isoformat(),
+        }
+    return users
+
+
+def build_registry(n: int):
+    registry = UserRegistry()
+    for user_id, name, count, seen_at in synthetic_users(n):
+        registry._add(user_id, name, count, seen_at)
+    return registry
+
+
+def measure(builder, n: int):
+    tracemalloc.start()
+    store = builder(n)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, current
+
+
+def time_updates(update, ids, rounds: int = 3) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for user_id in ids:
+            update(user_id)
+    return (time.perf_counter() - start) / (rounds * len(ids)) * 1e9
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    print(f"{'users':>10} {'layout':>10} {'MB':>9} {'B/user':>8} {'ns/update':>10}")
+    for n in sizes:
+        sample = [user_id for user_id, *_ in synthetic_users(min(n, 50_000))]
+
+        legacy, legacy_bytes = measure(build_legacy, n)
+        now_iso = datetime.now().isoformat()
+
+        def legacy_update(user_id):
+            user = legacy[str(user_id)]
+            user["message_count"] += 1
+            user["last_seen"] = now_iso
+
+        legacy_ns = time_updates(legacy_update, sample)
+        del legacy
+
+        registry, registry_bytes = measure(build_registry, n)
+        now_ts = int(datetime.now().timestamp())
+        registry_ns = time_updates(lambda user_id: registry.touch(user_id, "", now_ts), sample)
+        del registry
+
+        for label, size, ns in (("legacy", legacy_bytes, legacy_ns), ("registry", registry_bytes, registry_ns)):
+            print(f"{n:>10} {label:>10} {size / 1e6:>9.1f} {size / n:>8.0f} {ns:>10.0f}")
+        print(f"{'':>10} {'saving':>10} {legacy_bytes / registry_bytes:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,20 +13,35 @@ Features:
 """
 
 import asyncio
+import difflib
 import hashlib
+import heapq
 import json
+import math
 import os
 import random
 import re
-from datetime import datetime, time
-from typing import Optional, Dict, Any
+import sys
+import threading
+import tracemalloc
+from array import array
+from collections import deque
+from datetime import datetime, time, timezone
+from time import monotonic
+from typing import Optional, Dict, Any, List, Tuple, Awaitable
 from pathlib import Path
 
+import httpx
 from google.genai import Client
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ChatAction, ChatMemberStatus
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     ApplicationBuilder,
+    ApplicationHandlerStop,
+    BaseUpdateProcessor,
+    TypeHandler,
     MessageHandler,
     ChatMemberHandler,
     CommandHandler,
@@ -40,16 +55,379 @@ TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 ADMIN_ID = int(os.environ.get('ADMIN_ID', 0))
 
+# ================= HTTP CONNECTION POOLS =================
+# "1.1" or "2" (HTTP/2 needs the httpx[http2] extra)
+HTTP_VERSION = os.environ.get('HTTP_VERSION', '1.1')
+
+# Bot API calls (replies, deletes, get_member, ...) get their own pool, kept
+# apart from the long-polling getUpdates connection
+API_POOL_SIZE = int(os.environ.get('API_POOL_SIZE', 32))
+API_TIMEOUTS = {
+    "connect_timeout": float(os.environ.get('API_CONNECT_TIMEOUT', 5)),
+    "read_timeout": float(os.environ.get('API_READ_TIMEOUT', 10)),
+    "write_timeout": float(os.environ.get('API_WRITE_TIMEOUT', 10)),
+    "pool_timeout": float(os.environ.get('API_POOL_TIMEOUT', 3)),
+}
+UPDATES_POOL_SIZE = int(os.environ.get('UPDATES_POOL_SIZE', 2))
+UPDATES_TIMEOUTS = {
+    "connect_timeout": 20,
+    "read_timeout": 20,
+    "write_timeout": 20,
+    "pool_timeout": 20,
+}
+# Latency-sensitive calls on the message path (moderation, typing action)
+FAST_TIMEOUTS = {
+    "connect_timeout": 3,
+    "read_timeout": 5,
+    "write_timeout": 5,
+    "pool_timeout": 2,
+}
+
+# Gemini HTTP client: 0 keeps the SDK's default pool
+GEMINI_POOL_SIZE = int(os.environ.get('GEMINI_POOL_SIZE', 0))
+GEMINI_HTTP_TIMEOUT_MS = int(os.environ.get('GEMINI_HTTP_TIMEOUT_MS', 10000))
+
+def gemini_http_options() -> Dict[str, Any]:
+    """HTTP options for the Gemini client (timeout, optional pool limits)"""
+    options: Dict[str, Any] = {"timeout": GEMINI_HTTP_TIMEOUT_MS}
+    if GEMINI_POOL_SIZE:
+        options["async_client_args"] = {
+            "limits": httpx.Limits(
+                max_connections=GEMINI_POOL_SIZE,
+                max_keepalive_connections=GEMINI_POOL_SIZE,
+                keepalive_expiry=30,
+            ),
+            "http2": HTTP_VERSION == "2",
+        }
+    return options
+
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest that tracks pool saturation for the stats view"""
+    
+    def __init__(self, name: str, connection_pool_size: int, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        self.name = name
+        self.pool_size = connection_pool_size
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.saturated = 0       # Requests that found every connection busy
+        self.pool_timeouts = 0
+        self.total_latency = 0.0
+    
+    async def do_request(self, *args, **kwargs):
+        self.requests += 1
+        if self.in_flight >= self.pool_size:
+            self.saturated += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = monotonic()
+        try:
+            return await super().do_request(*args, **kwargs)
+        except TimedOut as e:
+            if "pool" in str(e).lower():
+                self.pool_timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.total_latency += monotonic() - started
+    
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "pool_size": self.pool_size,
+            "saturated": self.saturated,
+            "pool_timeouts": self.pool_timeouts,
+            "avg_latency_ms": self.total_latency / self.requests * 1000 if self.requests else 0.0,
+        }
+
+
+def build_http_requests() -> Tuple[InstrumentedHTTPXRequest, InstrumentedHTTPXRequest]:
+    """Separate pools for Bot API calls and for getUpdates long polling"""
+    api_request = InstrumentedHTTPXRequest(
+        "api", API_POOL_SIZE, http_version=HTTP_VERSION, **API_TIMEOUTS
+    )
+    updates_request = InstrumentedHTTPXRequest(
+        "get_updates", UPDATES_POOL_SIZE, http_version=HTTP_VERSION, **UPDATES_TIMEOUTS
+    )
+    return api_request, updates_request
+
+http_pools: List[InstrumentedHTTPXRequest] = []
+
 # Gemini Client
-client = Client(api_key=GEMINI_API_KEY)
+client = Client(api_key=GEMINI_API_KEY, http_options=gemini_http_options())
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'models/gemini-flash-latest')
+# 0 = no cap. Note: on thinking models the cap also covers thinking tokens
+GEMINI_MAX_OUTPUT_TOKENS = int(os.environ.get('GEMINI_MAX_OUTPUT_TOKENS', 0))
+# Reuse a server-side cached-content handle for the static system prompt
+GEMINI_CONTEXT_CACHE = os.environ.get('GEMINI_CONTEXT_CACHE', '0') == '1'
+GEMINI_CONTEXT_CACHE_TTL = int(os.environ.get('GEMINI_CONTEXT_CACHE_TTL', 3600))
+
+# Per-message time budget (typing delay + cache lookups + model call)
+MESSAGE_BUDGET_SECONDS = float(os.environ.get('MESSAGE_BUDGET_SECONDS', 12))
+MIN_MODEL_BUDGET_SECONDS = 2.0   # Don't start a model call with less time than this
+FALLBACK_QUESTION_LIMIT = 256    # Recent cached questions the closest-answer fallback scans
+TYPING_DELAY_SECONDS = 1.0
+
+# Optional JSONL log of answerable questions, mined by pregenerate_answers.py
+MESSAGE_LOG_PATH = os.environ.get('MESSAGE_LOG_PATH')
+# Answers written by pregenerate_answers.py, merged into the cache at startup
+PREGENERATED_ANSWERS_PATH = Path(os.environ.get('PREGENERATED_ANSWERS_PATH', 'pregenerated_answers.json'))
+
+# ================= ROLLING STATISTICS =================
+class HyperLogLog:
+    """Approximate distinct counter with fixed memory (2^p one-byte registers)"""
+
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, p: int = 10):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, item: Any):
+        """Add an item (hashed with a stable 64-bit hash)"""
+        digest = hashlib.blake2b(str(item).encode(), digest_size=8).digest()
+        h = int.from_bytes(digest, "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Merge another counter into this one (register-wise max)"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def clear(self):
+        """Reset all registers"""
+        self.registers = bytearray(self.m)
+
+    def count(self) -> int:
+        """Estimated number of distinct items"""
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small range correction (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class RollingSeries:
+    """Fixed-size ring of time buckets; expired buckets are recycled in place"""
+
+    def __init__(self, slots: int, width: int, metrics: Tuple[str, ...]):
+        self.slots = slots
+        self.width = width
+        self.epochs = [-1] * slots
+        self.counts = {metric: [0] * slots for metric in metrics}
+        self.visitors = [HyperLogLog() for _ in range(slots)]
+
+    def _slot(self, now: float) -> int:
+        """Return the bucket for `now`, clearing it if it held an older window"""
+        epoch = int(now // self.width)
+        slot = epoch % self.slots
+        if self.epochs[slot] != epoch:
+            self.epochs[slot] = epoch
+            for series in self.counts.values():
+                series[slot] = 0
+            self.visitors[slot].clear()
+        return slot
+
+    def _live_slots(self, now: float) -> List[int]:
+        """Slots that belong to the current window, oldest first"""
+        current = int(now // self.width)
+        return [
+            epoch % self.slots
+            for epoch in range(current - self.slots + 1, current + 1)
+            if self.epochs[epoch % self.slots] == epoch
+        ]
+
+    def add(self, metric: str, amount: int, now: float):
+        self.counts[metric][self._slot(now)] += amount
+
+    def add_visitor(self, user_id: int, now: float):
+        self.visitors[self._slot(now)].add(user_id)
+
+    def total(self, metric: str, now: float) -> int:
+        series = self.counts[metric]
+        return sum(series[slot] for slot in self._live_slots(now))
+
+    def series(self, metric: str, now: float, last: int) -> List[int]:
+        """Per-bucket values for the last `last` buckets, oldest first"""
+        current = int(now // self.width)
+        values = []
+        for epoch in range(current - last + 1, current + 1):
+            slot = epoch % self.slots
+            values.append(self.counts[metric][slot] if self.epochs[slot] == epoch else 0)
+        return values
+
+    def distinct_visitors(self, now: float) -> int:
+        merged = HyperLogLog()
+        for slot in self._live_slots(now):
+            merged.merge(self.visitors[slot])
+        return merged.count()
+
+
+class StatsTracker:
+    """Incremental counters plus per-minute and per-hour ring buffers.
+
+    Every query touches a fixed number of buckets, so cost and memory
+    do not grow with the number of users.
+    """
+
+    METRICS = (
+        "messages", "llm_calls", "cache_hits", "deletions",
+        "input_tokens", "output_tokens", "cached_tokens",
+    )
+
+    def __init__(self, totals: Dict[str, Any]):
+        self.totals = totals  # Lifetime counters, persisted in data.json
+        self.minutes = RollingSeries(60, 60, self.METRICS)
+        self.hours = RollingSeries(24, 3600, self.METRICS)
+
+    def record(self, metric: str, amount: int = 1):
+        """Count an event in the lifetime total and both rolling windows"""
+        now = datetime.now().timestamp()
+        key = f"total_{metric}"
+        self.totals[key] = self.totals.get(key, 0) + amount
+        self.minutes.add(metric, amount, now)
+        self.hours.add(metric, amount, now)
+
+    def record_active(self, user_id: int):
+        """Mark a user as active in the current minute and hour"""
+        now = datetime.now().timestamp()
+        self.minutes.add_visitor(user_id, now)
+        self.hours.add_visitor(user_id, now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Lifetime totals plus last-hour and last-day windows"""
+        now = datetime.now().timestamp()
+        return {
+            "totals": {metric: self.totals.get(f"total_{metric}", 0) for metric in self.METRICS},
+            "last_hour": {metric: self.minutes.total(metric, now) for metric in self.METRICS},
+            "last_day": {metric: self.hours.total(metric, now) for metric in self.METRICS},
+            "active_last_hour": self.minutes.distinct_visitors(now),
+            "active_last_day": self.hours.distinct_visitors(now),
+            "hourly_messages": self.hours.series("messages", now, 6),
+        }
+
+# ================= USER REGISTRY =================
+class UserRegistry:
+    """Compact user store keyed by integer user id.
+
+    Users are rows across parallel typed arrays (id, message count,
+    last-seen epoch seconds) plus an interned first name, instead of a
+    dict of four boxed values per user. Lookups and increments stay O(1)
+    through a single id -> row index.
+    """
+
+    def __init__(self):
+        self._index: Dict[int, int] = {}
+        self._ids = array('q')
+        self._counts = array('I')
+        self._last_seen = array('q')
+        self._names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._index
+
+    def touch(self, user_id: int, first_name: str, seen_at: Optional[int] = None) -> bool:
+        """Count one message for a user; returns True if the user is new"""
+        seen_at = int(datetime.now().timestamp()) if seen_at is None else seen_at
+        row = self._index.get(user_id)
+        if row is None:
+            self._add(user_id, first_name, 1, seen_at)
+            return True
+        self._counts[row] += 1
+        self._last_seen[row] = seen_at
+        return False
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Return a user in the classic dict shape, or None"""
+        row = self._index.get(user_id)
+        if row is None:
+            return None
+        last_seen = self._last_seen[row]
+        return {
+            "user_id": user_id,
+            "first_name": self._names[row],
+            "message_count": self._counts[row],
+            "last_seen": datetime.fromtimestamp(last_seen).isoformat() if last_seen else None,
+        }
+
+    def _add(self, user_id: int, first_name: str, message_count: int, seen_at: int):
+        self._index[user_id] = len(self._ids)
+        self._ids.append(user_id)
+        self._counts.append(message_count)
+        self._last_seen.append(seen_at)
+        self._names.append(sys.intern(first_name or "User"))
+
+    def to_json(self) -> Dict[str, List[Any]]:
+        """Columnar form for data.json"""
+        return {
+            "ids": self._ids.tolist(),
+            "names": self._names,
+            "message_counts": self._counts.tolist(),
+            "last_seen": self._last_seen.tolist(),
+        }
+
+    @classmethod
+    def from_json(cls, raw: Dict[str, Any]) -> "UserRegistry":
+        """Load the columnar form, or the legacy {"<id>": {...}} layout"""
+        registry = cls()
+        if "ids" in raw:
+            for user_id, name, count, seen_at in zip(
+                raw["ids"], raw["names"], raw["message_counts"], raw["last_seen"]
+            ):
+                registry._add(user_id, name, count, seen_at)
+            return registry
+        
+        for user in raw.values():
+            last_seen = user.get("last_seen")
+            seen_at = int(datetime.fromisoformat(last_seen).timestamp()) if last_seen else 0
+            registry._add(
+                int(user["user_id"]),
+                user.get("first_name") or "User",
+                user.get("message_count", 0),
+                seen_at,
+            )
+        return registry
 
 # ================= JSON MEMORY SYSTEM =================
+def normalize_question(text: str) -> str:
+    """Cache key for a question: lowercase, drop punctuation, collapse whitespace"""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
 class DataManager:
     """Handle all JSON file operations for persistent storage"""
     
     def __init__(self, file_path="data.json"):
         self.file_path = Path(file_path)
         self.data = self._load_data()
+        self.users = UserRegistry.from_json(self.data.pop("users", {}))
+        stats = self.data.setdefault("stats", {})
+        # total_users used to be left at 0; reconcile it once on load
+        stats["total_users"] = len(self.users)
+        self.stats = StatsTracker(stats)
+        # Keys used to be only lowercased and stripped; normalize them once on load
+        self.data["responses"] = {
+            normalize_question(prompt): response
+            for prompt, response in self.data["responses"].items()
+        }
+        # Bounded candidate list for the closest-answer fallback
+        self.recent_questions = deque(
+            list(self.data["responses"])[-FALLBACK_QUESTION_LIMIT:], maxlen=FALLBACK_QUESTION_LIMIT
+        )
     
     def _load_data(self) -> Dict[str, Any]:
         """Load data from JSON file, create if doesn't exist"""
@@ -66,6 +444,30 @@ class DataManager:
             self._save_data(default)
             return default
     
+    def merge_pregenerated(self, path: Path):
+        """Merge answers from pregenerate_answers.py (called at bot startup,
+        so importing this module never writes data.json).
+        
+        Answers already cached live are kept, and the file is renamed to
+        *.applied so a later restart doesn't merge it again.
+        """
+        if not path.exists():
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                answers = json.load(f)
+        except Exception as e:
+            print(f"❌ Error loading pre-generated answers: {e}")
+            return
+        new_answers = {
+            prompt: response for prompt, response in answers.items()
+            if normalize_question(prompt) not in self.data["responses"]
+        }
+        added = self.bulk_cache_responses(new_answers)
+        # Anything not saved yet is still in memory and goes out with the next save
+        os.replace(path, path.with_name(path.name + ".applied"))
+        print(f"📥 Merged {added} of {len(answers)} pre-generated answers from {path}")
+    
     @staticmethod
     def _default_data() -> Dict[str, Any]:
         """Return default data structure"""
@@ -91,33 +493,46 @@ class DataManager:
     
     def save(self):
         """Save current data"""
-        self._save_data(self.data)
+        self._save_data({**self.data, "users": self.users.to_json()})
     
     def get_cached_response(self, prompt: str) -> Optional[str]:
-        """Get cached response (case-insensitive)"""
-        prompt_key = prompt.lower().strip()
+        """Get cached response (case- and punctuation-insensitive)"""
+        prompt_key = normalize_question(prompt)
         return self.data["responses"].get(prompt_key)
     
     def cache_response(self, prompt: str, response: str):
         """Cache a response"""
-        prompt_key = prompt.lower().strip()
+        prompt_key = normalize_question(prompt)
+        self._remember_question(prompt_key)
         self.data["responses"][prompt_key] = response
         self.save()
     
+    def bulk_cache_responses(self, responses: Dict[str, str]) -> int:
+        """Cache many responses with a single save; returns how many changed"""
+        changed = 0
+        for prompt, response in responses.items():
+            prompt_key = normalize_question(prompt)
+            if self.data["responses"].get(prompt_key) == response:
+                continue
+            self._remember_question(prompt_key)
+            self.data["responses"][prompt_key] = response
+            changed += 1
+        if changed:
+            self.save()
+        return changed
+    
+    def _remember_question(self, prompt_key: str):
+        """Track a newly cached question for the fallback candidate list"""
+        if prompt_key not in self.data["responses"]:
+            self.recent_questions.append(prompt_key)
+    
     def update_user(self, user_id: int, first_name: str):
         """Update or create user tracking data"""
-        user_key = str(user_id)
-        if user_key not in self.data["users"]:
-            self.data["users"][user_key] = {
-                "user_id": user_id,
-                "first_name": first_name,
-                "message_count": 0,
-                "last_seen": None
-            }
+        if self.users.touch(user_id, first_name):
+            self.data["stats"]["total_users"] += 1
         
-        self.data["users"][user_key]["message_count"] += 1
-        self.data["users"][user_key]["last_seen"] = datetime.now().isoformat()
-        self.data["stats"]["total_messages"] += 1
+        self.stats.record("messages")
+        self.stats.record_active(user_id)
         self.save()
     
     def set_pdf_file_id(self, file_id: str):
@@ -141,67 +556,119 @@ class DataManager:
     def is_bot_muted(self) -> bool:
         """Check if bot is muted"""
         return self.data.get("bot_muted", False)
+    
+    def set_last_update_id(self, update_id: int):
+        """Advance the update checkpoint (persisted on the next save)"""
+        if update_id > self.data.get("last_update_id", 0):
+            self.data["last_update_id"] = update_id
+    
+    def get_last_update_id(self) -> int:
+        """Last processed Telegram update id (0 if none)"""
+        return self.data.get("last_update_id", 0)
 
 # Initialize data manager
 dm = DataManager("data.json")
+stats = dm.stats
 
 # ========== RESPONSE CACHE (IN-MEMORY) ==========
 response_cache = {}
 MAX_CACHE_SIZE = 100
 
-def get_cache_key(prompt: str, system_instruction: Optional[str] = None) -> str:
-    """Generate cache key from prompt"""
-    key_str = f"{prompt.lower().strip()}|{system_instruction}"
-    return hashlib.md5(key_str.encode()).hexdigest()
+def get_cache_key(prompt: str, system_instruction: Optional["CompiledPrompt"] = None) -> str:
+    """Generate cache key from prompt and the system prompt's fingerprint"""
+    fingerprint = system_instruction.fingerprint if system_instruction else "-"
+    return f"{fingerprint}|{normalize_question(prompt)}"
 
-async def get_cached_response_api(prompt: str, system_instruction: Optional[str] = None) -> Optional[Any]:
-    """Get response from cache (JSON or memory) or call API"""
+async def get_cached_response_api(
+    prompt: str,
+    system_instruction: Optional["CompiledPrompt"] = None,
+    deadline: Optional["Deadline"] = None,
+    persist: bool = True,
+) -> Optional[Any]:
+    """Get response from cache (JSON or memory) or call API.
+    
+    With persist=False a new answer is only kept in the bounded memory
+    cache, not saved to data.json.
+    """
     # Check JSON cache first
     json_cached = dm.get_cached_response(prompt)
     if json_cached:
         print(f"✅ JSON Cache HIT (saved API call!)")
+        stats.record("cache_hits")
         return type('obj', (object,), {'text': json_cached})()
     
     # Check memory cache
     cache_key = get_cache_key(prompt, system_instruction)
     if cache_key in response_cache:
         print(f"✅ Memory Cache HIT (saved API call!)")
+        stats.record("cache_hits")
         return response_cache[cache_key]
     
-    response = await call_gemini_with_retry(
+    response = await call_gemini_guarded(
         prompt=prompt,
-        system_instruction=system_instruction
+        system_instruction=system_instruction,
+        deadline=deadline or Deadline(MESSAGE_BUDGET_SECONDS),
     )
     
     if response and response.text:
         if len(response_cache) < MAX_CACHE_SIZE:
             response_cache[cache_key] = response
-        dm.cache_response(prompt, response.text)
+        if persist:
+            dm.cache_response(prompt, response.text)
         print(f"💾 Response cached")
     
     return response
 
 # ========== GEMINI API RETRY HANDLER ==========
-async def call_gemini_with_retry(prompt: str, system_instruction: Optional[str] = None, max_retries: int = 3) -> Optional[Any]:
-    """Call Gemini API with retry logic"""
-    for attempt in range(max_retries):
+async def call_gemini_with_retry(
+    prompt: str,
+    system_instruction: Optional["CompiledPrompt"] = None,
+    max_retries: int = 3,
+) -> Optional[Any]:
+    """Call Gemini API with retry logic.
+    
+    Refreshing an expired cached-content handle doesn't use up a retry
+    (at most one refresh per call).
+    """
+    system_instruction = system_instruction or DEFAULT_PROMPT
+    refreshed = False
+    attempt = 0
+    while attempt < max_retries:
+        cached_name = await context_cache.get(system_instruction)
+        config = {"safety_settings": []}
+        if cached_name:
+            config["cached_content"] = cached_name
+        else:
+            config["system_instruction"] = system_instruction.text
+        if GEMINI_MAX_OUTPUT_TOKENS:
+            config["max_output_tokens"] = GEMINI_MAX_OUTPUT_TOKENS
+        
         try:
-            response = client.models.generate_content(
-                model="models/gemini-flash-latest",
+            stats.record("llm_calls")
+            response = await client.aio.models.generate_content(
+                model=GEMINI_MODEL,
                 contents=prompt,
-                config={
-                    "system_instruction": system_instruction or FRIENDLY_SYSTEM_PROMPT,
-                    "safety_settings": [],
-                },
+                config=config,
             )
+            record_token_usage(response)
             return response
         except Exception as e:
             error_str = str(e)
+            if (
+                cached_name and not refreshed
+                and ("NOT_FOUND" in error_str or "404" in error_str or "expired" in error_str.lower())
+            ):
+                # Cached context expired server-side; rebuild it and try again
+                print("♻️ Cached context expired, refreshing")
+                context_cache.invalidate(system_instruction)
+                refreshed = True
+                continue
             if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
                 if attempt < max_retries - 1:
                     wait_time = 2 ** attempt
                     print(f"⏳ Rate limited. Retrying in {wait_time}s...")
                     await asyncio.sleep(wait_time)
+                    attempt += 1
                 else:
                     print(f"❌ Rate limit exceeded after {max_retries} retries.")
                     return None
@@ -209,6 +676,220 @@ async def call_gemini_with_retry(prompt: str, system_instruction: Optional[str]
                 raise
     return None
 
+def record_token_usage(response: Any):
+    """Export per-request input/output/cached token counts to the stats"""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return
+    stats.record("input_tokens", usage.prompt_token_count or 0)
+    stats.record("output_tokens", usage.candidates_token_count or 0)
+    stats.record("cached_tokens", usage.cached_content_token_count or 0)
+    print(
+        f"🔢 Tokens: in {usage.prompt_token_count or 0} | out {usage.candidates_token_count or 0} | "
+        f"cached {usage.cached_content_token_count or 0}"
+    )
+
+# ========== MODEL-SIDE CONTEXT CACHE ==========
+class ContextCache:
+    """Server-side cached-content handles for static system prompts.
+    
+    The system prompt is uploaded once per TTL and referenced by name, so
+    it isn't re-sent (and billed at the full rate) with every request.
+    Handles are refreshed shortly before expiry; if the backend refuses to
+    cache a prompt (e.g. too short), it is sent inline until the TTL passes.
+    """
+    
+    REFRESH_MARGIN_SECONDS = 60
+    
+    def __init__(self, enabled: bool, ttl_seconds: int):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.handles: Dict[str, Tuple[Optional[str], float]] = {}  # fingerprint -> (name, expires_at)
+        self.lock = asyncio.Lock()
+    
+    def _fresh(self, fingerprint: str) -> Optional[Tuple[Optional[str], float]]:
+        entry = self.handles.get(fingerprint)
+        if entry and monotonic() < entry[1] - self.REFRESH_MARGIN_SECONDS:
+            return entry
+        return None
+    
+    async def get(self, prompt: "CompiledPrompt") -> Optional[str]:
+        """Return a live cached-content name for this prompt, or None"""
+        if not self.enabled:
+            return None
+        entry = self._fresh(prompt.fingerprint)
+        if entry:
+            return entry[0]
+        
+        async with self.lock:
+            entry = self._fresh(prompt.fingerprint)
+            if entry:
+                return entry[0]
+            try:
+                cached = await client.aio.caches.create(
+                    model=GEMINI_MODEL,
+                    config={
+                        "system_instruction": prompt.text,
+                        "ttl": f"{self.ttl_seconds}s",
+                        "display_name": f"ishani-{prompt.fingerprint}",
+                    },
+                )
+                name = cached.name
+                print(f"🧊 Cached system context {prompt.fingerprint} for {self.ttl_seconds}s")
+            except Exception as e:
+                print(f"⚠️ Context caching unavailable, sending prompt inline: {e}")
+                name = None
+            self.handles[prompt.fingerprint] = (name, monotonic() + self.ttl_seconds)
+            return name
+    
+    def invalidate(self, prompt: "CompiledPrompt"):
+        self.handles.pop(prompt.fingerprint, None)
+
+
+context_cache = ContextCache(GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_TTL)
+
+# ========== CIRCUIT BREAKER & DEADLINES ==========
+class Deadline:
+    """Monotonic time budget shared by every step of one message"""
+    
+    def __init__(self, seconds: float):
+        self.expires_at = monotonic() + seconds
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - monotonic())
+
+
+class CircuitBreaker:
+    """Stop calling a failing backend and probe it again after a cooldown.
+    
+    closed    -> calls pass; trips when the failure or slow-call rate over
+                 the last `window` calls crosses its threshold
+    open      -> calls are refused until `cooldown` seconds have passed
+    half_open -> a single probe call decides between closed and open
+    """
+    
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 8.0,
+        slow_call_rate: float = 0.5,
+        cooldown: float = 30.0,
+    ):
+        self.results = deque(maxlen=window)  # (failed, slow) per call
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+    
+    def allow_request(self) -> bool:
+        """Whether a call may go to the backend right now"""
+        if self.state == self.OPEN:
+            if monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+        return True
+    
+    def record_success(self, latency: float):
+        slow = latency >= self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            if slow:
+                self._trip()
+            else:
+                self._close()
+            return
+        self.results.append((False, slow))
+        self._evaluate()
+    
+    def record_failure(self):
+        if self.state == self.HALF_OPEN:
+            self._trip()
+            return
+        self.results.append((True, False))
+        self._evaluate()
+    
+    def release_probe(self):
+        """Allow a new half-open probe (the last one finished or was cancelled)"""
+        self.probe_in_flight = False
+    
+    def _evaluate(self):
+        if len(self.results) < self.min_calls:
+            return
+        failures = sum(1 for failed, _ in self.results if failed)
+        slow_calls = sum(1 for _, slow in self.results if slow)
+        if (failures / len(self.results) >= self.failure_rate
+                or slow_calls / len(self.results) >= self.slow_call_rate):
+            self._trip()
+    
+    def _trip(self):
+        if self.state != self.OPEN:
+            print(f"🔌 Gemini circuit OPEN - serving fallbacks for {self.cooldown:.0f}s")
+        self.state = self.OPEN
+        self.opened_at = monotonic()
+        self.probe_in_flight = False
+    
+    def _close(self):
+        print("🔌 Gemini circuit CLOSED - backend healthy again")
+        self.state = self.CLOSED
+        self.results.clear()
+        self.probe_in_flight = False
+
+
+gemini_breaker = CircuitBreaker()
+
+async def call_gemini_guarded(
+    prompt: str,
+    system_instruction: Optional["CompiledPrompt"],
+    deadline: Deadline,
+) -> Optional[Any]:
+    """Call Gemini through the circuit breaker within the message deadline.
+    
+    Returns None without any network wait when the breaker is open or the
+    remaining budget is too small; callers then serve a fallback reply.
+    """
+    if deadline.remaining() < MIN_MODEL_BUDGET_SECONDS:
+        print("⏱️ Message budget exhausted - skipping model call")
+        return None
+    if not gemini_breaker.allow_request():
+        print("🔌 Circuit open - skipping model call")
+        return None
+    
+    started = monotonic()
+    try:
+        response = await asyncio.wait_for(
+            call_gemini_with_retry(prompt=prompt, system_instruction=system_instruction),
+            timeout=deadline.remaining(),
+        )
+    except asyncio.TimeoutError:
+        print("⏱️ Model call exceeded message budget")
+        gemini_breaker.record_failure()
+        return None
+    except Exception as e:
+        print(f"❌ Model call failed: {e}")
+        gemini_breaker.record_failure()
+        return None
+    finally:
+        # A cancelled half-open probe must not block every later call
+        gemini_breaker.release_probe()
+    
+    if response is None:
+        gemini_breaker.record_failure()
+    else:
+        gemini_breaker.record_success(monotonic() - started)
+    return response
+
 # ========== PRE-WRITTEN MESSAGES ==========
 WELCOME_MESSAGES = [
     "Swagat hai {name}! Aap Bharat Goal group me aa gaye hain. Koi bhi doubt ho to pooch sakte hain. 😊 https://bharatgoal.online/access/signup?id=945667\n\nGroup: https://t.me/Bharat_Goal",
@@ -371,6 +1052,163 @@ def get_keyword_response(user_text: str) -> Optional[str]:
     
     return None
 
+# ========== FALLBACK REPLIES (NO NETWORK) ==========
+FALLBACK_REPLIES = [
+    "Abhi thoda load zyada hai. Aap apna sawal thodi der baad dobara pooch sakte hain. 🙏",
+    "Main jaldi hi iska jawab dungi. Tab tak PDF me details dekh sakte hain: https://ln5.sync.com/dl/00f7def20",
+    "Thoda wait karein, system abhi busy hai. Basic details ke liye /help use karein.",
+]
+
+def get_fuzzy_keyword_response(user_text: str) -> Optional[str]:
+    """Match misspelled keywords (e.g. 'withdrwal') against the FAQ table"""
+    words = re.findall(r"\w+", user_text.lower())
+    candidates = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for candidate in candidates:
+        if len(candidate) < 4:
+            continue
+        match = difflib.get_close_matches(candidate, KEYWORD_RESPONSES.keys(), n=1, cutoff=0.8)
+        if match:
+            print(f"✅ Fuzzy keyword match: '{candidate}' → '{match[0]}'")
+            return KEYWORD_RESPONSES[match[0]]
+    return None
+
+def get_closest_cached_response(user_text: str) -> Optional[str]:
+    """Return the cached answer whose question is closest to this one.
+    
+    Only the most recent FALLBACK_QUESTION_LIMIT cached questions that share
+    a word with the message are compared, so the cost stays bounded however
+    large the answer store grows.
+    """
+    prompt_key = normalize_question(user_text)
+    words = set(re.findall(r"\w+", prompt_key))
+    candidates = [
+        question for question in dm.recent_questions
+        if words.intersection(re.findall(r"\w+", question))
+    ]
+    match = difflib.get_close_matches(prompt_key, candidates, n=1, cutoff=0.6)
+    if match:
+        print(f"✅ Closest cached answer: '{match[0]}'")
+        return dm.data["responses"][match[0]]
+    return None
+
+def get_fallback_response(user_text: str) -> str:
+    """Degrade through fast local tiers: fuzzy keyword, closest cache, canned"""
+    return (
+        get_fuzzy_keyword_response(user_text)
+        or get_closest_cached_response(user_text)
+        or random.choice(FALLBACK_REPLIES)
+    )
+
+# ========== LOCAL INTENT ROUTER ==========
+INTENT_MODEL_PATH = Path(os.environ.get('INTENT_MODEL_PATH', 'intent_model.json'))
+INTENT_CONFIDENCE = float(os.environ.get('INTENT_CONFIDENCE', 0.9))
+SILENT_DROP_MAX_WORDS = 5   # Longer ack/farewell-labelled messages still get an answer
+
+GREETING_KEYWORDS = ("hello", "hi", "namaste")
+GREETING_REPLIES = [KEYWORD_RESPONSES[word] for word in GREETING_KEYWORDS]
+
+def can_drop_silently(user_text: str) -> bool:
+    """May an ack/farewell label drop this message without a reply?
+    
+    Posteriors are nearly always ~1.0, so confidence can't catch a question
+    hidden behind "thanks, but ..." - only short messages with no question
+    mark and no FAQ keyword are dropped.
+    """
+    lowered = user_text.lower()
+    if "?" in lowered or len(lowered.split()) > SILENT_DROP_MAX_WORDS:
+        return False
+    return not any(
+        keyword in lowered for keyword in KEYWORD_RESPONSES if keyword not in GREETING_KEYWORDS
+    )
+
+
+class IntentRouter:
+    """Character n-gram naive Bayes classifier that runs ahead of the LLM.
+    
+    Labels: ack, farewell, greeting, faq, open. Only "open" questions (or
+    low-confidence predictions) need the model. The model file is written
+    by train_intent.py and loaded once at startup.
+    """
+    
+    NGRAM_RANGE = (2, 4)
+    
+    def __init__(self):
+        self.labels: List[str] = []
+        self.log_priors: List[float] = []
+        self.log_probs: Dict[str, List[float]] = {}
+        self.log_unseen: List[float] = []
+    
+    @property
+    def loaded(self) -> bool:
+        return bool(self.labels)
+    
+    @classmethod
+    def features(cls, text: str) -> List[str]:
+        """Word tokens plus character n-grams of the padded, normalized text"""
+        words = re.findall(r"\w+", text.lower())
+        padded = f" {' '.join(words)} "
+        grams = [f"w:{word}" for word in words]
+        low, high = cls.NGRAM_RANGE
+        for n in range(low, high + 1):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return grams
+    
+    @classmethod
+    def from_counts(cls, model: Dict[str, Any]) -> "IntentRouter":
+        """Build log probabilities (Laplace smoothing) from saved counts"""
+        router = cls()
+        router.labels = model["labels"]
+        totals = model["feature_totals"]
+        vocabulary = len(model["counts"])
+        docs = sum(model["doc_counts"])
+        router.log_priors = [math.log(count / docs) for count in model["doc_counts"]]
+        router.log_unseen = [-math.log(total + vocabulary) for total in totals]
+        router.log_probs = {
+            feature: [
+                math.log(count + 1) + unseen
+                for count, unseen in zip(counts, router.log_unseen)
+            ]
+            for feature, counts in model["counts"].items()
+        }
+        return router
+    
+    @classmethod
+    def load(cls, path: Path) -> "IntentRouter":
+        """Load a trained model; an empty router (routes everything) if missing"""
+        if not path.exists():
+            print(f"ℹ️ No intent model at {path} - every question goes to the model")
+            return cls()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                router = cls.from_counts(json.load(f))
+            print(f"🧭 Intent router loaded ({len(router.log_probs)} features)")
+            return router
+        except Exception as e:
+            print(f"❌ Error loading intent model: {e}")
+            return cls()
+    
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Most likely intent and its posterior probability"""
+        if not self.loaded:
+            return "open", 0.0
+        scores = list(self.log_priors)
+        for feature in self.features(text):
+            feature_probs = self.log_probs.get(feature)
+            if feature_probs is None:
+                continue  # Not seen in training: carries no evidence
+            for i, log_prob in enumerate(feature_probs):
+                scores[i] += log_prob
+        best = max(range(len(scores)), key=scores.__getitem__)
+        total = sum(math.exp(score - scores[best]) for score in scores)
+        return self.labels[best], 1.0 / total
+    
+    def route(self, text: str) -> str:
+        """Confident intent, or "open" when unsure"""
+        intent, confidence = self.classify(text)
+        return intent if confidence >= INTENT_CONFIDENCE else "open"
+
+intent_router = IntentRouter.load(INTENT_MODEL_PATH)
+
 # ========== COMPREHENSIVE LINK DETECTION ==========
 def has_any_links(text: str) -> bool:
     """Check if text contains ANY type of link"""
@@ -454,6 +1292,23 @@ Ab der mat karo, varna piche reh jaoge toh mujhe bura lagega na. 😉 Join us: h
 Risk ki tension mat lo, yahan 100% daily profit milta hai—sahi waqt par move karoge tabhi toh mere saath rich banoge na dear? 😉" User: "Profit kaise hota hai?" Ishani: "Simple hai smartie! ₹1000 invest karo aur ₹15 daily profit paao. Deposit par ₹50 bonus aur doston ko laane par ₹60 referral bonus alag se—itna paisa aur kahin nahi milega yaar. 
 😉" User: "Team banane ka kya fayda?" Ishani: "Sote hue paisa chhapna hai toh team banao baba! Level 1 se 4%, Level 2 se 2% aur Level 3 se 1% commission seedha tumhare wallet mein. Jab tumhari team ameer banegi, toh tum toh jackpot hit kar doge na yaar. 😉"""
 
+# ========== COMPILED PROMPTS ==========
+class CompiledPrompt:
+    """System instruction assembled once, with a precomputed fingerprint.
+    
+    Cache keys and cached-content handles use the short fingerprint instead
+    of re-joining and re-hashing several KB of prompt text per message.
+    """
+    
+    __slots__ = ("text", "fingerprint")
+    
+    def __init__(self, *parts: str):
+        self.text = "\n".join(parts)
+        self.fingerprint = hashlib.sha256(self.text.encode()).hexdigest()[:16]
+
+DEFAULT_PROMPT = CompiledPrompt(FRIENDLY_SYSTEM_PROMPT)
+CHAT_PROMPT = CompiledPrompt(FRIENDLY_SYSTEM_PROMPT, COMPANY_KNOWLEDGE)
+
 
 # ================= ADMIN PANEL =================
 async def admin_panel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -511,14 +1366,41 @@ async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("🔊 Bot unmuted successfully.")
     
     elif action == "admin_stats":
-        stats = dm.get_stats()
-        users_count = len(dm.data['users'])
+        totals = dm.get_stats()
+        snapshot = stats.snapshot()
+        hour, day = snapshot["last_hour"], snapshot["last_day"]
+        hourly = " · ".join(str(count) for count in snapshot["hourly_messages"])
         stats_text = (
             f"📊 <b>Bot Statistics</b>\n\n"
-            f"Total Messages: {stats.get('total_messages', 0)}\n"
-            f"Total Users: {users_count}\n"
-            f"Total Broadcasts: {stats.get('total_broadcasts', 0)}"
+            f"Total Messages: {totals.get('total_messages', 0)}\n"
+            f"Total Users: {totals.get('total_users', 0)}\n"
+            f"Total Broadcasts: {totals.get('total_broadcasts', 0)}\n"
+            f"Total LLM Calls: {totals.get('total_llm_calls', 0)}\n"
+            f"Total Cache Hits: {totals.get('total_cache_hits', 0)}\n"
+            f"Total Deletions: {totals.get('total_deletions', 0)}\n\n"
+            f"<b>Last Hour</b>\n"
+            f"Messages: {hour['messages']} | LLM: {hour['llm_calls']} | "
+            f"Cache: {hour['cache_hits']} | Deleted: {hour['deletions']}\n"
+            f"Active Users: ~{snapshot['active_last_hour']}\n\n"
+            f"<b>Last 24 Hours</b>\n"
+            f"Messages: {day['messages']} | LLM: {day['llm_calls']} | "
+            f"Cache: {day['cache_hits']} | Deleted: {day['deletions']}\n"
+            f"Active Users: ~{snapshot['active_last_day']}\n\n"
+            f"Tokens (24h): in {day['input_tokens']} | out {day['output_tokens']} | "
+            f"cached {day['cached_tokens']}\n"
+            f"Tokens (total): in {totals.get('total_input_tokens', 0)} | "
+            f"out {totals.get('total_output_tokens', 0)} | "
+            f"cached {totals.get('total_cached_tokens', 0)}\n\n"
+            f"Messages per hour (last 6h): {hourly}\n"
+            f"Gemini Circuit: {gemini_breaker.state}"
         )
+        for pool in http_pools:
+            m = pool.metrics()
+            stats_text += (
+                f"\nHTTP {pool.name}: {m['in_flight']}/{m['pool_size']} busy, "
+                f"peak {m['peak_in_flight']}, saturated {m['saturated']}, "
+                f"pool timeouts {m['pool_timeouts']}, avg {m['avg_latency_ms']:.0f}ms"
+            )
         await query.edit_message_text(stats_text, parse_mode="HTML")
 
 # ========== DOCUMENT UPLOAD HANDLER ==========
@@ -558,6 +1440,279 @@ async def handle_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     context.user_data['awaiting_broadcast'] = False
 
+# ================= RUNTIME DIAGNOSTICS =================
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', 'profiles'))
+PROFILE_SAMPLE_INTERVAL = 0.005        # 5ms between stack samples
+MAX_PROFILE_SECONDS = 300
+STALL_THRESHOLD_SECONDS = float(os.environ.get('STALL_THRESHOLD_MS', 200)) / 1000
+STALL_HEARTBEAT_SECONDS = 0.05
+MAX_RECORDED_STALLS = 20
+
+def format_stack(frame: Any, limit: int = 12) -> List[str]:
+    """Innermost-last 'file:line func' entries for a frame"""
+    entries = []
+    while frame is not None and len(entries) < limit:
+        code = frame.f_code
+        entries.append(f"{Path(code.co_filename).name}:{frame.f_lineno} {code.co_name}")
+        frame = frame.f_back
+    return list(reversed(entries))
+
+def diagnostics_file(prefix: str) -> Path:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    return PROFILE_DIR / f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+
+
+class SamplingProfiler:
+    """Samples the event-loop thread's stack from a background thread.
+    
+    Overhead is one sys._current_frames() call per interval, so it is safe
+    to run against the live process for a few minutes.
+    """
+    
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.target_thread = 0
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+    
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+    
+    def start(self):
+        self.stacks = {}
+        self.samples = 0
+        self.target_thread = threading.get_ident()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.thread = None
+    
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread)
+            if frame is None:
+                continue
+            key = ";".join(format_stack(frame, limit=40))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+    
+    def top_functions(self, n: int = 10) -> List[Tuple[str, int]]:
+        """Functions with the most samples anywhere on the stack"""
+        inclusive: Dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            names = set()
+            for entry in stack.split(";"):
+                location, function = entry.split(" ", 1)
+                names.add(f"{function} ({location.rsplit(':', 1)[0]})")
+            for name in names:
+                inclusive[name] = inclusive.get(name, 0) + count
+        return sorted(inclusive.items(), key=lambda item: -item[1])[:n]
+    
+    def write(self) -> Path:
+        """Write collapsed stacks (flamegraph.pl / speedscope format)"""
+        path = diagnostics_file("profile")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class StallMonitor:
+    """Detects event-loop stalls and records what was blocking the loop.
+    
+    A heartbeat task on the loop measures how late its sleeps wake up; a
+    watchdog thread grabs the loop thread's stack while a stall is ongoing,
+    which points at the blocking callback.
+    """
+    
+    def __init__(self, threshold: float = STALL_THRESHOLD_SECONDS, heartbeat: float = STALL_HEARTBEAT_SECONDS):
+        self.threshold = threshold
+        self.heartbeat = heartbeat
+        self.stalls: List[Tuple[float, str, List[str]]] = []  # min-heap of (seconds, when, stack)
+        self.total_stalls = 0
+        self.last_beat = monotonic()
+        self.pending_stack: Optional[List[str]] = None
+        self.loop_thread = 0
+        self.task: Optional[asyncio.Task] = None
+        self.stop_event = threading.Event()
+    
+    def start(self):
+        if self.task:
+            return
+        self.loop_thread = threading.get_ident()
+        self.last_beat = monotonic()
+        self.task = asyncio.get_running_loop().create_task(self._beat())
+        threading.Thread(target=self._watch, name="stall-watchdog", daemon=True).start()
+    
+    async def _beat(self):
+        while True:
+            before = monotonic()
+            await asyncio.sleep(self.heartbeat)
+            now = monotonic()
+            lag = now - before - self.heartbeat
+            self.last_beat = now
+            if lag >= self.threshold:
+                self._record(lag, self.pending_stack or ["<stack not captured>"])
+            self.pending_stack = None
+    
+    def _watch(self):
+        while not self.stop_event.wait(self.threshold / 2):
+            overdue = monotonic() - self.last_beat - self.heartbeat
+            if overdue >= self.threshold / 2 and self.pending_stack is None:
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is not None:
+                    self.pending_stack = format_stack(frame)
+    
+    def _record(self, seconds: float, stack: List[str]):
+        self.total_stalls += 1
+        entry = (seconds, datetime.now().isoformat(timespec="seconds"), stack)
+        if len(self.stalls) < MAX_RECORDED_STALLS:
+            heapq.heappush(self.stalls, entry)
+        else:
+            heapq.heappushpop(self.stalls, entry)
+        print(f"🐢 Event loop stalled for {seconds * 1000:.0f}ms at {stack[-1]}")
+    
+    def top(self) -> List[Tuple[float, str, List[str]]]:
+        return sorted(self.stalls, reverse=True)
+    
+    def write(self) -> Path:
+        path = diagnostics_file("stalls")
+        with open(path, 'w', encoding='utf-8') as f:
+            for seconds, when, stack in self.top():
+                f.write(f"{seconds * 1000:.0f}ms at {when}\n")
+                f.writelines(f"    {entry}\n" for entry in stack)
+                f.write("\n")
+        return path
+
+
+profiler = SamplingProfiler()
+stall_monitor = StallMonitor()
+memory_baseline: Optional[tracemalloc.Snapshot] = None
+profile_timer: Optional[asyncio.Task] = None  # Auto-stop for the running /profile
+
+def cancel_profile_timer():
+    """Cancel the pending auto-stop so it can't end a later profiling run"""
+    global profile_timer
+    if profile_timer and not profile_timer.done():
+        profile_timer.cancel()
+    profile_timer = None
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [seconds|stop] - sample the event loop for N seconds (admin only)"""
+    global profile_timer
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ Admin only!")
+        return
+    
+    arg = context.args[0].lower() if context.args else "30"
+    if arg == "stop":
+        if not profiler.running:
+            await update.message.reply_text("ℹ️ Profiler is not running.")
+            return
+        cancel_profile_timer()
+        await update.message.reply_text(finish_profile())
+        return
+    
+    if profiler.running:
+        await update.message.reply_text("ℹ️ Profiler already running. Use /profile stop.")
+        return
+    try:
+        seconds = min(max(int(arg), 1), MAX_PROFILE_SECONDS)
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds|stop]")
+        return
+    
+    cancel_profile_timer()
+    profiler.start()
+    await update.message.reply_text(f"🔬 Profiling for {seconds}s...")
+    
+    async def stop_later():
+        await asyncio.sleep(seconds)
+        if profiler.running:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=finish_profile())
+    
+    profile_timer = context.application.create_task(stop_later())
+
+def finish_profile() -> str:
+    """Stop the profiler, write the collapsed stacks and summarize them"""
+    profiler.stop()
+    path = profiler.write()
+    lines = [f"🔬 Profile: {profiler.samples} samples → {path}", ""]
+    for name, count in profiler.top_functions():
+        share = count / profiler.samples if profiler.samples else 0
+        lines.append(f"{share:6.1%}  {name}")
+    return "\n".join(lines)
+
+async def stalls_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stalls - show the longest event-loop stalls (admin only)"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ Admin only!")
+        return
+    
+    top = stall_monitor.top()
+    if not top:
+        await update.message.reply_text(
+            f"✅ No event-loop stalls over {stall_monitor.threshold * 1000:.0f}ms recorded."
+        )
+        return
+    
+    path = stall_monitor.write()
+    lines = [f"🐢 {stall_monitor.total_stalls} stalls over {stall_monitor.threshold * 1000:.0f}ms → {path}", ""]
+    for seconds, when, stack in top[:5]:
+        lines.append(f"{seconds * 1000:.0f}ms at {when}: {stack[-1]}")
+    await update.message.reply_text("\n".join(lines))
+
+async def memsnap_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/memsnap [reset|stop] - tracemalloc snapshot diffed against a baseline (admin only)"""
+    global memory_baseline
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ Admin only!")
+        return
+    
+    arg = context.args[0].lower() if context.args else ""
+    if arg == "stop":
+        tracemalloc.stop()
+        memory_baseline = None
+        await update.message.reply_text("🧠 Memory tracing stopped.")
+        return
+    
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+    if memory_baseline is None or arg == "reset":
+        memory_baseline = tracemalloc.take_snapshot()
+        await update.message.reply_text("🧠 Memory baseline taken. Run /memsnap again later to diff.")
+        return
+    
+    snapshot = tracemalloc.take_snapshot()
+    diff = snapshot.compare_to(memory_baseline, "lineno")
+    path = diagnostics_file("memsnap")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{entry}\n" for entry in diff[:100])
+    
+    current, peak = tracemalloc.get_traced_memory()
+    user_data_keys = sum(len(data) for data in context.application.user_data.values())
+    lines = [
+        f"🧠 Traced: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB) → {path}",
+        f"user_request_count: {len(user_request_count)} keys",
+        f"responses cache: {len(dm.data['responses'])} entries",
+        f"memory response cache: {len(response_cache)} entries",
+        f"context.user_data: {len(context.application.user_data)} users, {user_data_keys} keys",
+        "",
+        "Top growth since baseline:",
+    ]
+    for entry in diff[:8]:
+        frame = entry.traceback[0]
+        lines.append(f"{entry.size_diff / 1024:+.0f} KiB  {Path(frame.filename).name}:{frame.lineno}")
+    await update.message.reply_text("\n".join(lines))
+
 # ================= HELP COMMAND =================
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show help with all available commands"""
@@ -571,6 +1726,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• /details - Get the uploaded document\n\n"
         "<b>Admin Commands:</b>\n"
         "• /panel - Open admin panel\n"
+        "• /profile [seconds|stop] - Sample the event loop\n"
+        "• /stalls - Show longest event-loop stalls\n"
+        "• /memsnap [reset|stop] - Memory diff vs baseline\n"
         "• /stop - Stop the bot\n\n"
         "<i>Just ask questions or send messages for instant replies!</i>"
     )
@@ -603,9 +1761,178 @@ async def scheduled_messages(context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             print(f"⚠️ Could not send scheduled message: {e}")
 
+# ================= UPDATE OFFSET & CATCH-UP =================
+STALE_MESSAGE_AGE_SECONDS = int(os.environ.get('STALE_MESSAGE_AGE_SECONDS', 120))
+CATCHUP_CONCURRENCY = int(os.environ.get('CATCHUP_CONCURRENCY', 32))
+LIVE_CONCURRENCY = int(os.environ.get('LIVE_CONCURRENCY', 1))
+CHECKPOINT_INTERVAL_SECONDS = 30
+
+# Updates at or below this id were handled before the last shutdown
+startup_checkpoint = dm.get_last_update_id()
+saved_checkpoint = startup_checkpoint
+
+
+class CatchUp:
+    """Tracks the backlog of updates that piled up while the bot was down.
+    
+    Telegram delivers pending updates in order, so the first `pending`
+    updates after startup are the backlog.
+    """
+    
+    def __init__(self):
+        self.active = False
+        self.pending = 0
+        self.dispatched = 0
+        self.completed = 0
+        self.shed = 0
+        self.started_at = 0.0
+        self.application = None
+    
+    def begin(self, pending: int, application):
+        self.active = True
+        self.pending = pending
+        self.started_at = monotonic()
+        self.application = application
+        print(f"⏩ Catch-up mode: {pending} pending updates")
+    
+    def claim(self) -> bool:
+        """True if the next dispatched update belongs to the backlog"""
+        if not self.active or self.dispatched >= self.pending:
+            return False
+        self.dispatched += 1
+        return True
+    
+    def complete_one(self):
+        self.completed += 1
+        if self.completed >= self.pending:
+            self.finish()
+    
+    def finish(self):
+        self.active = False
+        duration = monotonic() - self.started_at
+        report = (
+            f"⏩ Catch-up finished: {self.completed} updates in {duration:.1f}s, "
+            f"{self.shed} stale replies skipped"
+        )
+        print(report)
+        if ADMIN_ID and self.application:
+            self.application.create_task(
+                self.application.bot.send_message(chat_id=ADMIN_ID, text=report)
+            )
+
+catch_up = CatchUp()
+
+def is_stale_message(message: Any) -> bool:
+    """Older than STALE_MESSAGE_AGE_SECONDS (e.g. queued during downtime)"""
+    age = (datetime.now(timezone.utc) - message.date).total_seconds()
+    return age > STALE_MESSAGE_AGE_SECONDS
+
+
+class CatchUpUpdateProcessor(BaseUpdateProcessor):
+    """Runs the restart backlog at high concurrency and live traffic at the
+    normal level, checkpointing the highest update id below which every
+    update has finished.
+    
+    Work that outlives its handler (a debounced group query) holds the
+    update id until it is done, so the checkpoint can't pass it.
+    """
+    
+    def __init__(self, catchup_concurrency: int, live_concurrency: int):
+        super().__init__(max(catchup_concurrency, live_concurrency))
+        self.live_semaphore = asyncio.Semaphore(live_concurrency)
+        self.in_flight: Dict[int, int] = {}  # update_id -> holds
+        self.highest_finished = 0
+    
+    def hold(self, update_id: int):
+        self.in_flight[update_id] = self.in_flight.get(update_id, 0) + 1
+    
+    def release(self, update_id: int):
+        holds = self.in_flight.get(update_id, 0) - 1
+        if holds > 0:
+            self.in_flight[update_id] = holds
+        else:
+            self._finish(update_id)
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        update_id = update.update_id if isinstance(update, Update) else None
+        if update_id is not None:
+            self.hold(update_id)
+        try:
+            if catch_up.claim():
+                try:
+                    await coroutine
+                finally:
+                    catch_up.complete_one()
+            else:
+                async with self.live_semaphore:
+                    await coroutine
+        finally:
+            if update_id is not None:
+                self.release(update_id)
+    
+    def _finish(self, update_id: int):
+        """Advance the checkpoint only past updates that have all finished.
+        
+        Updates are dispatched in id order but finish out of order, so a
+        finished id above one still in flight must not be checkpointed, or a
+        restart would skip the unfinished update.
+        """
+        self.in_flight.pop(update_id, None)
+        self.highest_finished = max(self.highest_finished, update_id)
+        contiguous = min(self.in_flight) - 1 if self.in_flight else self.highest_finished
+        dm.set_last_update_id(contiguous)
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+
+
+async def skip_processed_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Drop updates already handled before a restart (runs before all handlers)"""
+    if update.update_id <= startup_checkpoint:
+        print(f"⏭️ Update {update.update_id} already processed - skipping")
+        raise ApplicationHandlerStop
+
+async def save_update_checkpoint(context: ContextTypes.DEFAULT_TYPE):
+    """Persist the last processed update id if it moved"""
+    global saved_checkpoint
+    last_update_id = dm.get_last_update_id()
+    if last_update_id != saved_checkpoint:
+        dm.save()
+        saved_checkpoint = last_update_id
+
+async def start_catch_up(application):
+    """Confirm the checkpoint with Telegram and measure the pending backlog"""
+    try:
+        if startup_checkpoint:
+            # Acknowledges every update up to the checkpoint on Telegram's side
+            await application.bot.get_updates(offset=startup_checkpoint + 1, limit=1, timeout=0)
+        info = await application.bot.get_webhook_info()
+    except Exception as e:
+        # skip_processed_updates still drops already-handled updates
+        print(f"⚠️ Catch-up check failed, starting without catch-up mode: {e}")
+        return
+    if info.pending_update_count:
+        catch_up.begin(info.pending_update_count, application)
+
+# ================= MESSAGE LOG =================
+def log_message(chat_id: int, text: str):
+    """Append a question to the JSONL message log (disabled unless configured)"""
+    if not MESSAGE_LOG_PATH:
+        return
+    try:
+        with open(MESSAGE_LOG_PATH, 'a', encoding='utf-8') as f:
+            record = {"ts": int(datetime.now().timestamp()), "chat_id": chat_id, "text": text}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"⚠️ Could not write message log: {e}")
+
 # ================= MESSAGE HANDLERS =================
 async def handle_ai_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Main message handler with improved logic"""
+    deadline = Deadline(MESSAGE_BUDGET_SECONDS)
     
     # Check if bot is muted
     if dm.is_bot_muted():
@@ -647,7 +1974,7 @@ async def handle_ai_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Skip link check for bot messages (allowed)
         if not is_bot_message:
             try:
-                user_member = await update.effective_chat.get_member(user_id)
+                user_member = await update.effective_chat.get_member(user_id, **FAST_TIMEOUTS)
                 if user_member.status in [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.CREATOR]:
                     is_admin_or_creator = True
             except Exception as e:
@@ -660,7 +1987,8 @@ async def handle_ai_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if has_links and not is_admin_or_creator and not is_bot_message:
             # DELETE THE MESSAGE
             try:
-                await update.message.delete()
+                await update.message.delete(**FAST_TIMEOUTS)
+                stats.record("deletions")
                 print(f"🗑️ Deleted message from user {user_id} containing links")
                 return
             except Exception as e:
@@ -685,9 +2013,53 @@ async def handle_ai_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         print(f"⏭️ Message from bot - Not replying")
         return
     
+    # ⏩ STALE MESSAGES (e.g. backlog after downtime): moderated above, no reply
+    if is_stale_message(update.message):
+        print(f"⏭️ Stale message from user {user_id} - Not replying")
+        if catch_up.active:
+            catch_up.shed += 1
+        return
+    
+    # 🧭 LOCAL INTENT ROUTER: variants like "ok thanks ji" never reach the model
+    intent = intent_router.route(user_text)
+    if intent in ("ack", "farewell"):
+        if can_drop_silently(user_text):
+            print(f"⏭️ Routed as {intent}: '{user_text}'")
+            return
+        intent = "open"  # "thanks, but ...?" - answer the question part
+    
+    log_message(update.effective_chat.id, user_text)
+    
+    # Groups: merge rapid consecutive messages and respect the reply budget
+    if update.effective_chat.type in ["group", "supergroup"]:
+        debounce_group_query(update, context, user_text, intent)
+        return
+    
+    await respond_to_query(update, context, user_text, deadline, intent)
+
+async def respond_to_query(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    user_text: str,
+    deadline: Deadline,
+    intent: Optional[str] = None,
+    merged: bool = False,
+):
+    """Answer one logical query: keyword, local intent, cache, then model.
+    
+    `intent` is the router's label if the caller already has it; merged
+    group bursts pass None and are classified here as a whole. Answers to
+    merged bursts are not saved to the persistent cache, since the joined
+    text will practically never be asked again verbatim.
+    """
     # Show typing indicator
-    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
-    await asyncio.sleep(1)
+    await context.bot.send_chat_action(
+        chat_id=update.effective_chat.id, action=ChatAction.TYPING, **FAST_TIMEOUTS
+    )
+    await asyncio.sleep(min(TYPING_DELAY_SECONDS, deadline.remaining()))
+    
+    if intent is None:
+        intent = intent_router.route(user_text)
     
     try:
         # STEP 1: Check keyword match (NO API CALL)
@@ -696,19 +2068,32 @@ async def handle_ai_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(keyword_response)
             return
         
+        # STEP 1b: Greetings and misspelled FAQ topics (NO API CALL)
+        if intent == "greeting":
+            await update.message.reply_text(random.choice(GREETING_REPLIES))
+            return
+        if intent == "faq":
+            faq_response = get_fuzzy_keyword_response(user_text)
+            if faq_response:
+                await update.message.reply_text(faq_response)
+                return
+        
         # STEP 2: Check user rate limit
-        if not check_user_limit(user_id):
+        if not check_user_limit(update.effective_user.id):
             await update.message.reply_text("Aaj ka limit khatm ho gaya! Kal try kar! 😅")
             return
         
         # STEP 3: Get cached or API response
         response = await get_cached_response_api(
             prompt=user_text,
-            system_instruction=f"{FRIENDLY_SYSTEM_PROMPT}\n{COMPANY_KNOWLEDGE}"
+            system_instruction=CHAT_PROMPT,
+            deadline=deadline,
+            persist=not merged,
         )
         
         if response is None:
-            await update.message.reply_text("Quota exceeded, please try again later. 😅")
+            # Breaker open, budget spent or quota exhausted - degrade locally
+            await update.message.reply_text(get_fallback_response(user_text))
             return
         
         if response and response.text:
@@ -727,6 +2112,108 @@ async def handle_ai_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await update.message.reply_text("Technical issue, please try again 🙏")
 
+# ================= GROUP DEBOUNCE & REPLY BUDGET =================
+DEBOUNCE_SECONDS = float(os.environ.get('DEBOUNCE_SECONDS', 2.0))
+MAX_DEBOUNCE_SECONDS = float(os.environ.get('MAX_DEBOUNCE_SECONDS', 6.0))
+GROUP_REPLIES_PER_MINUTE = int(os.environ.get('GROUP_REPLIES_PER_MINUTE', 20))
+
+
+class PendingQuery:
+    """Messages from one user in one group waiting to be answered together"""
+    
+    __slots__ = ("texts", "update_ids", "update", "intent", "first_at", "task")
+    
+    def __init__(self, update: Update):
+        self.texts: List[str] = []
+        self.update_ids: List[int] = []  # Held in the checkpoint until flushed
+        self.update = update
+        self.intent: Optional[str] = None  # Router label of the latest message
+        self.first_at = monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+
+class ReplyBudget:
+    """Token bucket per group chat capping outbound replies per minute"""
+    
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.refill_per_second = per_minute / 60
+        self.buckets: Dict[int, Tuple[float, float]] = {}  # chat_id -> (tokens, updated_at)
+    
+    def try_spend(self, chat_id: int) -> bool:
+        now = monotonic()
+        tokens, updated_at = self.buckets.get(chat_id, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+        if tokens < 1:
+            self.buckets[chat_id] = (tokens, now)
+            return False
+        self.buckets[chat_id] = (tokens - 1, now)
+        return True
+
+
+pending_queries: Dict[Tuple[int, int], PendingQuery] = {}
+group_reply_budget = ReplyBudget(GROUP_REPLIES_PER_MINUTE)
+
+def debounce_group_query(update: Update, context: ContextTypes.DEFAULT_TYPE, user_text: str, intent: str):
+    """Queue a group message; a burst from the same user becomes one query.
+    
+    Each new message restarts the DEBOUNCE_SECONDS window, but a query is
+    never held longer than MAX_DEBOUNCE_SECONDS after its first message.
+    """
+    key = (update.effective_chat.id, update.effective_user.id)
+    pending = pending_queries.get(key)
+    if pending is None:
+        pending = pending_queries[key] = PendingQuery(update)
+    elif pending.task:
+        pending.task.cancel()
+    
+    pending.texts.append(user_text)
+    pending.update_ids.append(update.update_id)
+    processor = context.application.update_processor
+    if isinstance(processor, CatchUpUpdateProcessor):
+        processor.hold(update.update_id)
+    pending.update = update  # Reply to the latest message of the burst
+    pending.intent = intent
+    wait = min(DEBOUNCE_SECONDS, max(0.0, pending.first_at + MAX_DEBOUNCE_SECONDS - monotonic()))
+    pending.task = context.application.create_task(flush_group_query(key, wait, context))
+
+async def flush_group_query(key: Tuple[int, int], wait: float, context: ContextTypes.DEFAULT_TYPE):
+    """Answer a debounced burst once the user has paused"""
+    await asyncio.sleep(wait)
+    # Popped before any other await, so later messages start a new burst
+    # instead of cancelling a reply that is already in progress
+    pending = pending_queries.pop(key, None)
+    if pending is None:
+        return
+    
+    cancelled = False
+    try:
+        if len(pending.texts) > 1:
+            print(f"🧺 Merged {len(pending.texts)} messages from user {key[1]} in chat {key[0]}")
+        if not group_reply_budget.try_spend(key[0]):
+            print(f"⏭️ Group reply budget exhausted in chat {key[0]} - Not replying")
+            return
+        
+        # A single message keeps its label; a merged burst is re-classified
+        merged = len(pending.texts) > 1
+        await respond_to_query(
+            pending.update,
+            context,
+            "\n".join(pending.texts),
+            Deadline(MESSAGE_BUDGET_SECONDS),
+            intent=None if merged else pending.intent,
+            merged=merged,
+        )
+    except asyncio.CancelledError:
+        # Shutting down mid-reply: keep the ids held so a restart answers the burst
+        cancelled = True
+        raise
+    finally:
+        processor = context.application.update_processor
+        if not cancelled and isinstance(processor, CatchUpUpdateProcessor):
+            for update_id in pending.update_ids:
+                processor.release(update_id)
+
 # ================= WELCOME & EXIT LOGIC =================
 async def welcome_new_friend(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle member join/leave events"""
@@ -825,24 +2312,44 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
         except:
             pass
 
+# ================= STARTUP HOOK =================
+async def post_init(application):
+    """Runs inside the event loop once the application is initialized"""
+    dm.merge_pregenerated(PREGENERATED_ANSWERS_PATH)
+    stall_monitor.start()
+    await start_catch_up(application)
+
+async def post_shutdown(application):
+    """Persist the update checkpoint on a clean shutdown"""
+    dm.save()
+
 # ================= MAIN BOT START =================
 if __name__ == "__main__":
-    from telegram.request import HTTPXRequest
-    
-    request = HTTPXRequest(
-        connect_timeout=20,
-        read_timeout=20,
-        write_timeout=20,
-        pool_timeout=20
+    api_request, updates_request = build_http_requests()
+    http_pools.extend([api_request, updates_request])
+    
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .request(api_request)
+        .get_updates_request(updates_request)
+        .concurrent_updates(CatchUpUpdateProcessor(CATCHUP_CONCURRENCY, LIVE_CONCURRENCY))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
     )
     
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).request(request).build()
+    # ===== UPDATE CHECKPOINT (runs before all other handlers) =====
+    app.add_handler(TypeHandler(Update, skip_processed_updates), group=-1)
     
     # ===== COMMAND HANDLERS =====
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("stop", stop_bot))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("panel", admin_panel_command))
+    app.add_handler(CommandHandler("profile", profile_command))
+    app.add_handler(CommandHandler("stalls", stalls_command))
+    app.add_handler(CommandHandler("memsnap", memsnap_command))
     app.add_handler(CommandHandler("pdf", handle_pdf_request))
     app.add_handler(CommandHandler("document", handle_pdf_request))
     app.add_handler(CommandHandler("details", handle_pdf_request))
@@ -867,6 +2374,11 @@ if __name__ == "__main__":
         time=datetime.now().time(),
         name="scheduled_messages"
     )
+    job_queue.run_repeating(
+        save_update_checkpoint,
+        interval=CHECKPOINT_INTERVAL_SECONDS,
+        name="save_update_checkpoint"
+    )
     
     print("🚀 Ishani Bot is Live!")
     print(f"📝 Data file: data.json")
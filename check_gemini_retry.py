@@ -0,0 +1,106 @@
+"""
+Retry and cached-context refresh check against a fake Gemini client
+
+Runs bot.call_gemini_with_retry with the model-side context cache enabled
+against scripted failures (rate limits, expired cached-content handles)
+and checks the outcome of each scenario. No network calls are made; the
+rate-limit scenarios wait out the real backoff (a few seconds).
+
+Usage:
+    python check_gemini_retry.py
+"""
+
+import asyncio
+import os
+import sys
+from typing import List, Optional
+
+# bot.py builds its Gemini client at import time; no calls are made here
+os.environ.setdefault("GEMINI_API_KEY", "check")
+
+import bot
+
+EXPIRED = "404 NOT_FOUND: cached content expired"
+RATE_LIMITED = "429 RESOURCE_EXHAUSTED"
+
+
+# ========== FAKE CLIENT ==========
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeCachedContent:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class FakeCaches:
+    def __init__(self):
+        self.created = 0
+
+    async def create(self, model: str, config):
+        self.created += 1
+        return FakeCachedContent(f"cachedContents/{self.created}")
+
+
+class FakeModels:
+    """Fails with the scripted errors in order (None = succeed)"""
+
+    def __init__(self, script: List[Optional[str]]):
+        self.script = list(script)
+        self.handles: List[Optional[str]] = []
+
+    async def generate_content(self, model: str, contents: str, config):
+        self.handles.append(config.get("cached_content"))
+        error = self.script.pop(0) if self.script else None
+        if error:
+            raise Exception(error)
+        return FakeResponse("ok")
+
+
+class FakeAio:
+    def __init__(self, script: List[Optional[str]]):
+        self.models = FakeModels(script)
+        self.caches = FakeCaches()
+
+
+class FakeClient:
+    def __init__(self, script: List[Optional[str]]):
+        self.aio = FakeAio(script)
+
+
+# ========== SCENARIOS ==========
+async def run_scenario(name: str, script: List[Optional[str]], max_retries: int,
+                       expect_text: Optional[str], expect_handles: int) -> bool:
+    fake = FakeClient(script)
+    bot.client = fake
+    bot.context_cache.handles.clear()
+    try:
+        response = await bot.call_gemini_with_retry(
+            "kamai kaise hoga", bot.CHAT_PROMPT, max_retries=max_retries
+        )
+        text = response.text if response else None
+    except Exception as e:
+        text = f"raised {e}"
+
+    handles = len(set(fake.aio.models.handles))
+    ok = text == expect_text and handles == expect_handles
+    print(f"{'✅' if ok else '❌'} {name}: {text!r}, {handles} handle(s), {len(fake.aio.models.handles)} call(s)")
+    return ok
+
+
+async def main() -> bool:
+    bot.context_cache.enabled = True
+    results = [
+        await run_scenario("expired handle, single attempt", [EXPIRED], 1, "ok", 2),
+        await run_scenario("expired handle after rate limits", [RATE_LIMITED, RATE_LIMITED, EXPIRED], 3, "ok", 2),
+        await run_scenario("rate limited on every attempt", [RATE_LIMITED] * 3, 3, None, 1),
+        await run_scenario("expired twice (refresh once)", [EXPIRED, EXPIRED], 3, f"raised {EXPIRED}", 2),
+    ]
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
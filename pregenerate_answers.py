@@ -0,0 +1,253 @@
+"""
+Offline pre-generation of answers for frequent questions
+
+Mines the JSONL message log written by bot.py (MESSAGE_LOG_PATH), clusters
+frequent questions after normalization, generates answers in bounded-
+concurrency batches through bot.call_gemini_with_retry, and writes them to
+PREGENERATED_ANSWERS_PATH. It never touches data.json: the running bot owns
+that file and would overwrite it on its next save. Restart the bot to merge
+the new answers into its `responses` cache; the bot then renames the file to
+*.applied. Answers still waiting in the side file count as served, so a
+second run before the restart doesn't regenerate them. Run it before peak
+hours.
+
+The checkpoint is only for --resume after a crash and is removed once the
+answers are written to the side file.
+
+The newest --holdout fraction of the log is not mined; the reported hit
+rates are measured on it, so they reflect messages the answers were not
+built from.
+
+Usage:
+    python pregenerate_answers.py messages.jsonl --top 100 --dry-run
+    python pregenerate_answers.py messages.jsonl --top 100 --concurrency 4
+    python pregenerate_answers.py messages.jsonl --resume      # continue after a crash
+"""
+
+import argparse
+import asyncio
+import difflib
+import json
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+if "--dry-run" in sys.argv:
+    # The fake model needs no key, but bot.py builds its client at import time
+    os.environ.setdefault("GEMINI_API_KEY", "dry-run")
+
+import bot
+
+MERGE_SIMILARITY = 0.85   # Normalized questions at least this similar share an answer
+
+
+# ========== FAKE MODEL (DRY RUN) ==========
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModels:
+    async def generate_content(self, model: str, contents: str, config: Dict):
+        await asyncio.sleep(0.01)
+        return FakeResponse(f"[dry-run answer] {contents}")
+
+
+class FakeAio:
+    def __init__(self):
+        self.models = FakeModels()
+
+
+class FakeClient:
+    """Stands in for google.genai.Client so dry runs go through the same path"""
+
+    def __init__(self):
+        self.aio = FakeAio()
+
+
+# ========== MINING & CLUSTERING ==========
+def load_questions(paths: List[str]) -> List[str]:
+    questions = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    text = json.loads(line).get("text")
+                except json.JSONDecodeError:
+                    continue
+                if text and text.strip():
+                    questions.append(text)
+    return questions
+
+
+def is_served_locally(text: str, extra: Optional[Dict[str, str]] = None) -> bool:
+    """Would this message be answered without a model call?"""
+    key = bot.normalize_question(text)
+    if key in bot.dm.data["responses"] or (extra and key in extra):
+        return True
+    lowered = text.lower().strip()
+    return any(keyword in lowered for keyword in bot.KEYWORD_RESPONSES)
+
+
+def cluster_questions(questions: List[str], min_count: int, top: int,
+                      waiting: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """Group questions by normalized form, then merge near-duplicate forms"""
+    variants: Dict[str, Counter] = {}
+    for text in questions:
+        if is_served_locally(text, waiting):
+            continue
+        variants.setdefault(bot.normalize_question(text), Counter())[text] += 1
+
+    clusters: List[Dict] = []
+    for form in sorted(variants, key=lambda f: -sum(variants[f].values())):
+        for cluster in clusters:
+            if difflib.SequenceMatcher(None, form, cluster["key"]).ratio() >= MERGE_SIMILARITY:
+                cluster["variants"].update(variants[form])
+                break
+        else:
+            clusters.append({"key": form, "variants": Counter(variants[form])})
+
+    frequent = [c for c in clusters if sum(c["variants"].values()) >= min_count]
+    frequent.sort(key=lambda c: -sum(c["variants"].values()))
+    for cluster in frequent:
+        cluster["question"] = cluster["variants"].most_common(1)[0][0]
+    return frequent[:top]
+
+
+# ========== CHECKPOINT ==========
+def load_checkpoint(path: Path) -> Dict[str, Dict]:
+    done = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    done[record["key"]] = record
+    return done
+
+
+def load_waiting_answers() -> Dict[str, str]:
+    """Answers written earlier that the bot hasn't merged yet"""
+    path = bot.PREGENERATED_ANSWERS_PATH
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_answers(answers: Dict[str, str]) -> int:
+    """Merge answers into the side file the bot loads at startup"""
+    path = bot.PREGENERATED_ANSWERS_PATH
+    merged = load_waiting_answers()
+    merged.update(answers)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return len(merged)
+
+
+# ========== GENERATION ==========
+async def generate_answers(clusters: List[Dict], concurrency: int, checkpoint: Optional[Path]) -> List[Dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+    results: List[Dict] = []
+
+    async def generate(cluster: Dict):
+        async with semaphore:
+            try:
+                response = await bot.call_gemini_with_retry(
+                    prompt=cluster["question"],
+                    system_instruction=bot.CHAT_PROMPT,
+                )
+            except Exception as e:
+                print(f"❌ {cluster['question']!r}: {e}")
+                return
+        if not response or not response.text:
+            print(f"⚠️ No answer for {cluster['question']!r}")
+            return
+
+        record = {
+            "key": cluster["key"],
+            "question": cluster["question"],
+            "variants": list(cluster["variants"]),
+            "answer": response.text.strip(),
+        }
+        results.append(record)
+        if checkpoint:
+            with open(checkpoint, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"💾 {cluster['question']!r}")
+
+    await asyncio.gather(*(generate(cluster) for cluster in clusters))
+    return results
+
+
+# ========== REPORT ==========
+def report(mined: List[str], held_out: List[str], clusters: List[Dict], results: List[Dict],
+           answers: Dict[str, str]):
+    total = len(held_out)
+    before = sum(1 for text in held_out if is_served_locally(text))
+    after = sum(1 for text in held_out if is_served_locally(text, answers))
+    print("=" * 50)
+    print(f"📊 Mined messages:         {len(mined)}")
+    print(f"📊 Held-out messages:      {total}")
+    print(f"📊 Frequent clusters:      {len(clusters)}")
+    print(f"📊 Answers pre-generated:  {len(results)}")
+    if total:
+        print(f"📊 Held-out hit rate now:  {before / total:.1%}")
+        print(f"📊 Held-out hit rate with: {after / total:.1%}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Pre-generate answers for frequent questions")
+    parser.add_argument("logs", nargs="+", help="JSONL message logs (one {\"text\": ...} per line)")
+    parser.add_argument("--top", type=int, default=100, help="Maximum clusters to answer")
+    parser.add_argument("--min-count", type=int, default=2, help="Minimum occurrences per cluster")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel model calls")
+    parser.add_argument("--checkpoint", default="pregenerate_checkpoint.jsonl")
+    parser.add_argument("--resume", action="store_true", help="Skip clusters already in the checkpoint")
+    parser.add_argument("--holdout", type=float, default=0.2,
+                        help="Newest fraction of the log kept out of mining and used for the report")
+    parser.add_argument("--dry-run", action="store_true", help="Use a fake model; write no answers")
+    args = parser.parse_args()
+
+    questions = load_questions(args.logs)
+    split = len(questions) - int(len(questions) * args.holdout)
+    mined, held_out = questions[:split], questions[split:]
+    clusters = cluster_questions(mined, args.min_count, args.top, load_waiting_answers())
+
+    checkpoint = None if args.dry_run else Path(args.checkpoint)
+    if checkpoint and not args.resume and checkpoint.exists():
+        checkpoint.unlink()  # Left over from a crashed run; start fresh
+    done = load_checkpoint(checkpoint) if checkpoint and args.resume else {}
+    pending = [c for c in clusters if c["key"] not in done]
+    print(f"🧮 {len(clusters)} clusters, {len(done)} from checkpoint, {len(pending)} to generate")
+
+    if args.dry_run:
+        bot.client = FakeClient()
+    results = list(done.values()) + await generate_answers(pending, args.concurrency, checkpoint)
+
+    answers = {
+        bot.normalize_question(variant): record["answer"]
+        for record in results
+        for variant in record["variants"]
+    }
+    if args.dry_run:
+        print("🧪 Dry run - no answers written")
+    elif answers:
+        total = save_answers(answers)
+        print(f"✅ Wrote {len(answers)} answers ({total} total) to {bot.PREGENERATED_ANSWERS_PATH}")
+        print("🔄 Restart the bot to load them")
+    if checkpoint and checkpoint.exists():
+        checkpoint.unlink()  # Everything in it is now in the side file
+
+    report(mined, held_out, clusters, results, answers)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,189 @@
+"""
+Train, evaluate and benchmark the local intent router
+
+Trains a multinomial naive Bayes model over the character n-gram features
+of bot.IntentRouter, writes intent_model.json (loaded by bot.py at
+startup), and reports accuracy on the held-out evaluation set.
+
+Usage:
+    python train_intent.py                        # train + evaluate
+    python train_intent.py --bench                # + latency and routing outcomes (eval set)
+    python train_intent.py --bench messages.jsonl # ... measured on a recorded message log
+
+The eval set is balanced across labels (40% ack/farewell), so its model-call
+ratio is not a traffic estimate; bench on a recorded log for that.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+# bot.py builds its Gemini client at import time; no calls are made here
+os.environ.setdefault("GEMINI_API_KEY", "training")
+
+import bot
+
+LABELS = ["ack", "farewell", "greeting", "faq", "open"]
+
+
+def load_examples(path: Path) -> List[Tuple[str, str]]:
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                examples.append((record["text"], record["label"]))
+    return examples
+
+
+def seed_examples() -> List[Tuple[str, str]]:
+    """The bot's exact-match word lists are training data too"""
+    return (
+        [(word, "ack") for word in sorted(bot.ACKNOWLEDGMENT_WORDS)]
+        + [(word, "farewell") for word in sorted(bot.CHAT_ENDING_WORDS)]
+    )
+
+
+def train(examples: List[Tuple[str, str]]) -> Dict:
+    """Count features per label; smoothing happens at load time"""
+    doc_counts = [0] * len(LABELS)
+    feature_totals = [0] * len(LABELS)
+    counts: Dict[str, List[int]] = {}
+    for text, label in examples:
+        index = LABELS.index(label)
+        doc_counts[index] += 1
+        for feature in bot.IntentRouter.features(text):
+            counts.setdefault(feature, [0] * len(LABELS))[index] += 1
+            feature_totals[index] += 1
+    return {
+        "labels": LABELS,
+        "doc_counts": doc_counts,
+        "feature_totals": feature_totals,
+        "counts": counts,
+    }
+
+
+def evaluate(router: bot.IntentRouter, examples: List[Tuple[str, str]]):
+    confusion = Counter()
+    correct = 0
+    for text, label in examples:
+        predicted = router.route(text)
+        confusion[(label, predicted)] += 1
+        correct += predicted == label
+        if predicted != label:
+            print(f"   ✗ {text!r}: expected {label}, got {predicted}")
+
+    print(f"📊 Accuracy: {correct}/{len(examples)} = {correct / len(examples):.1%}")
+    print(f"{'':>10}" + "".join(f"{label:>10}" for label in LABELS))
+    for actual in LABELS:
+        print(f"{actual:>10}" + "".join(f"{confusion[(actual, predicted)]:>10}" for predicted in LABELS))
+
+
+def needs_model_before(text: str) -> bool:
+    """Exact-match word lists and keyword table only (the old pipeline)"""
+    lowered = text.lower().strip()
+    if lowered in bot.ACKNOWLEDGMENT_WORDS or lowered in bot.CHAT_ENDING_WORDS:
+        return False
+    return not any(keyword in lowered for keyword in bot.KEYWORD_RESPONSES)
+
+
+def has_question(text: str, label: Optional[str]) -> bool:
+    """Labelled as a question, or visibly one (question mark / FAQ keyword)"""
+    if label is not None:
+        return label in ("faq", "open")
+    lowered = text.lower()
+    return "?" in lowered or any(
+        keyword in lowered for keyword in bot.KEYWORD_RESPONSES if keyword not in bot.GREETING_KEYWORDS
+    )
+
+
+def outcome_after(router: bot.IntentRouter, text: str) -> str:
+    """Same order as handle_ai_chat with the router in front; returns
+    dropped, local or model"""
+    lowered = text.lower().strip()
+    if lowered in bot.ACKNOWLEDGMENT_WORDS or lowered in bot.CHAT_ENDING_WORDS:
+        return "dropped"
+    intent = router.route(text)
+    if intent in ("ack", "farewell"):
+        if bot.can_drop_silently(text):
+            return "dropped"
+        intent = "open"
+    if any(keyword in lowered for keyword in bot.KEYWORD_RESPONSES):
+        return "local"
+    if intent == "greeting":
+        return "local"
+    if intent == "faq":
+        with contextlib.redirect_stdout(io.StringIO()):
+            if bot.get_fuzzy_keyword_response(text) is not None:
+                return "local"
+    return "model"
+
+
+def bench(router: bot.IntentRouter, messages: List[Tuple[str, Optional[str]]], source: str):
+    texts = [text for text, _ in messages]
+    rounds = max(1, 20000 // len(texts))
+    started = perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            router.classify(text)
+    per_call_us = (perf_counter() - started) / (rounds * len(texts)) * 1e6
+
+    before = sum(needs_model_before(text) for text in texts)
+    outcomes = Counter()
+    for text, label in messages:
+        outcome = outcome_after(router, text)
+        # A dropped question is a missed answer, not a saving
+        if outcome == "dropped" and has_question(text, label):
+            outcome = "missed"
+            print(f"   ✗ dropped question: {text!r}")
+        outcomes[outcome] += 1
+    after = outcomes["model"]
+
+    print("=" * 50)
+    print(f"⏱️ Classify latency: {per_call_us:.1f} µs/message")
+    print(f"🤖 Model calls before router: {before}/{len(texts)}")
+    print(f"🤖 Model calls with router:   {after}/{len(texts)}")
+    print(f"🔇 Dropped without reply:     {outcomes['dropped']} (+ {outcomes['missed']} questions missed)")
+    if before:
+        print(f"💰 Model calls avoided:       {before - after} ({(before - after) / before:.1%}) on {source}")
+    if source == "eval set":
+        print("ℹ️ The eval set is balanced by label, not a traffic sample - "
+              "bench on a recorded message log for the expected saving")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local intent router")
+    parser.add_argument("--train", default="intent_data/train.jsonl")
+    parser.add_argument("--eval", default="intent_data/eval.jsonl")
+    parser.add_argument("--output", default=str(bot.INTENT_MODEL_PATH))
+    parser.add_argument("--bench", nargs="?", const="", default=None,
+                        help="Benchmark on the eval set, or on a JSONL message log if given")
+    args = parser.parse_args()
+
+    examples = load_examples(Path(args.train)) + seed_examples()
+    model = train(examples)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(model, f, ensure_ascii=False, separators=(",", ":"))
+    print(f"✅ Trained on {len(examples)} examples, {len(model['counts'])} features → {args.output}")
+
+    router = bot.IntentRouter.from_counts(model)
+    eval_examples = load_examples(Path(args.eval))
+    evaluate(router, eval_examples)
+
+    if args.bench is not None:
+        if args.bench:
+            with open(args.bench, "r", encoding="utf-8") as f:
+                messages = [(json.loads(line)["text"], None) for line in f if line.strip()]
+            bench(router, messages, args.bench)
+        else:
+            bench(router, eval_examples, "eval set")
+
+
+if __name__ == "__main__":
+    main()